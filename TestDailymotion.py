@@ -1,4 +1,5 @@
 import dailymotion
+import catalogsync
 import unittest
 import config
 import re
@@ -7,6 +8,11 @@ import os
 import pytest
 import sys
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
 class TestA(unittest.TestCase):
 
     @classmethod
@@ -163,3 +169,313 @@ class TestA(unittest.TestCase):
         self.assertEqual(isinstance (second_access_token, str) or isinstance(second_access_token, unicode), True)
         self.assertEqual(second_access_token, access_token)
         d.logout()
+
+    def test_auth_headers_cache(self):
+        d = dailymotion.Dailymotion()
+        d.set_grant_type('password', api_key='key', api_secret='secret', info={'username': 'user', 'password': 'pass'})
+        d._session_store.set({'access_token': 'token', 'expires': int(time.time() + 3600)})
+        sent_headers = []
+        d.request = lambda endpoint, method, params, files, headers=None: sent_headers.append(headers)
+        d.get('/videos')
+        d._session_store.set_value('access_token', 'other')
+        d.get('/videos')
+        self.assertEqual(sent_headers[0]['Authorization'], 'Bearer token')
+        self.assertIs(sent_headers[1], sent_headers[0])
+        self.assertFalse('Authorization' in d._headers)
+        d.set_access_token('other')
+        d._session_store.set_value('expires', int(time.time() + 3600))
+        d.get('/videos')
+        self.assertEqual(sent_headers[2]['Authorization'], 'Bearer other')
+
+    def test_auth_headers_cache_without_session_store(self):
+        d = dailymotion.Dailymotion(session_store_enabled=False)
+        d.set_grant_type('password', api_key='key', api_secret='secret', info={'username': 'user', 'password': 'pass'})
+        token_requests = []
+        def request(endpoint, method='GET', params=None, files=None, headers=None):
+            if endpoint == d.oauth_token_endpoint_url:
+                token_requests.append(params)
+                return {'access_token': 'token%d' % len(token_requests), 'expires_in': 3600}
+            return {'authorization': headers['Authorization']}
+        d.request = request
+        responses = [d.get('/videos') for _ in range(5)]
+        self.assertEqual(len(token_requests), 1)
+        self.assertEqual(set(r['authorization'] for r in responses), set(['Bearer token1']))
+
+    def test_query(self):
+        d = dailymotion.Dailymotion()
+        calls = []
+        def get(endpoint, params=None):
+            calls.append((endpoint, params))
+            return {'list': [{'id': 'x%d' % params['page']}], 'has_more': params['page'] < 3}
+        d.get = get
+        query = d.videos.filter(owner='x2abc').only('id', 'title').limit(10)
+        self.assertEqual([v['id'] for v in query.iter()], ['x1', 'x2', 'x3'])
+        self.assertEqual(calls[0], ('/videos', {'owner': 'x2abc', 'fields': 'id,title', 'limit': 10, 'page': 1}))
+        self.assertEqual(d.query('/user/x2abc/videos').params(), {'fields': 'id'})
+        self.assertRaises(dailymotion.DailymotionClientError, query.limit, 1000)
+        self.assertRaises(dailymotion.DailymotionClientError, query.limit, 'abc')
+        self.assertEqual(query.params(), {'owner': 'x2abc', 'fields': 'id,title', 'limit': 10})
+
+    def test_catalog_sync(self):
+        d = dailymotion.Dailymotion()
+        catalog = {
+            'x1': {'id': 'x1', 'title': 'a', 'created_time': 10, 'updated_time': 100},
+            'x2': {'id': 'x2', 'title': 'b', 'created_time': 20, 'updated_time': 200},
+        }
+        calls = []
+        def get(endpoint, params=None):
+            calls.append((endpoint, params))
+            if endpoint.startswith('/video/'):
+                if endpoint[len('/video/'):] not in catalog:
+                    raise dailymotion.DailymotionApiError('not found', error_type='not_found')
+                return {'id': endpoint[len('/video/'):]}
+            self.assertEqual(params['sort'], 'old')
+            fields = params['fields'].split(',')
+            items = sorted(catalog.values(), key=lambda v: (v['created_time'], v['id']))
+            items = [
+                dict((f, v[f]) for f in fields) for v in items
+                if v['updated_time'] > params.get('updated_after', -1) and v['created_time'] > params.get('created_after', -1)
+            ]
+            offset = (params.get('page', 1) - 1) * params['limit']
+            return {'list': items[offset:offset + params['limit']], 'has_more': len(items) > offset + params['limit']}
+        d.get = get
+        sync = catalogsync.CatalogSync(d, '/user/x2abc/videos', fields=('id', 'title'))
+        self.assertEqual(sorted((e, i['id']) for e, i in sync.run()), [('created', 'x1'), ('created', 'x2')])
+        self.assertEqual(sync.watermark, 200)
+        self.assertEqual(list(sync.run()), [])
+        self.assertEqual(calls[-1][1]['updated_after'], 199)
+        catalog['x2'] = {'id': 'x2', 'title': 'c', 'created_time': 20, 'updated_time': 300}
+        del catalog['x1']
+        self.assertEqual([(e, i['id']) for e, i in sync.run(full=True)], [('updated', 'x2'), ('deleted', 'x1')])
+        self.assertIn(('/video/x1', {'fields': 'id'}), calls)
+        sync.close()
+
+        # an item whose handling failed is replayed by the next run
+        sync = catalogsync.CatalogSync(d, '/user/x2abc/videos', fields=('id', 'title'))
+        catalog['x1'] = {'id': 'x1', 'title': 'a', 'created_time': 10, 'updated_time': 100}
+        handled = []
+        try:
+            for event, item in sync.run():
+                if item['id'] == 'x1':
+                    raise RuntimeError('consumer failure')
+                handled.append(item['id'])
+        except RuntimeError:
+            pass
+        handled.extend(item['id'] for event, item in sync.run())
+        self.assertEqual(sorted(handled), ['x1', 'x2'])
+        self.assertEqual(list(sync.run()), [])
+
+        # an item missing from the list but still online isn't reported as deleted
+        listed = get
+        def get(endpoint, params=None):
+            result = listed(endpoint, params)
+            if not endpoint.startswith('/video/'):
+                result['list'] = [item for item in result['list'] if item['id'] != 'x1']
+            return result
+        d.get = get
+        self.assertEqual(list(sync.run(full=True)), [])
+
+        # nothing is deleted when the walk fails
+        del catalog['x1']
+        catalog.update(('y%d' % i, {'id': 'y%d' % i, 'created_time': 30 + i, 'updated_time': 100}) for i in range(150))
+        def get(endpoint, params=None):
+            if params.get('created_after'):
+                raise dailymotion.DailymotionApiError('unavailable', error_type='server_error')
+            return listed(endpoint, params)
+        d.get = get
+        self.assertRaises(dailymotion.DailymotionApiError, list, sync.run(full=True))
+        self.assertEqual(sync._db.execute("SELECT COUNT(*) FROM items WHERE id = 'x1'").fetchone()[0], 1)
+        sync.close()
+
+        # keyset paging: deletions and updates during the walk don't shift the pages, and a whole page
+        # created within the same second doesn't stall the walk
+        catalog.clear()
+        catalog.update(('z%03d' % i, {'id': 'z%03d' % i, 'created_time': 1000 + i // 150, 'updated_time': 100})
+                       for i in range(250))
+        def get(endpoint, params=None):
+            result = listed(endpoint, params)
+            catalog.pop('z000', None)
+            catalog['z001']['updated_time'] = 500
+            return result
+        d.get = get
+        sync = catalogsync.CatalogSync(d, '/user/x2abc/videos')
+        seen = set(item['id'] for event, item in sync.run())
+        self.assertEqual(seen, set(catalog) | set(['z000']))
+        self.assertEqual(sync.watermark, 500)
+        sync.close()
+
+    def test_bulk(self):
+        d = dailymotion.Dailymotion()
+        calls = []
+        def request(endpoint, method, params, files, headers=None):
+            calls.append((endpoint, method))
+            if endpoint == '/video/x2':
+                raise dailymotion.DailymotionApiError('not found', error_type='not_found')
+            return {'id': endpoint.split('/')[-1]}
+        d.request = request
+        checkpoint = os.path.join(self.session_file_directory, 'bulk.log')
+        reports = d.bulk_delete(['/video/x1', '/video/x2', '/video/x3'], workers=2, checkpoint=checkpoint)
+        self.assertEqual([r['status'] for r in reports], ['done', 'error', 'done'])
+        self.assertEqual(len(calls), 3)
+        reports = d.bulk_delete(['/video/x1', '/video/x2', '/video/x3'], workers=2, checkpoint=checkpoint)
+        self.assertEqual([r['status'] for r in reports], ['skipped', 'error', 'skipped'])
+        self.assertEqual(calls[3:], [('/video/x2', 'DELETE')])
+        reports = d.bulk_post([('/video/x1', {'published': 'false'})])
+        self.assertEqual(reports[0]['result'], {'id': 'x1'})
+        os.remove(checkpoint)
+
+        # an unexpected error on one item doesn't stop the checkpointing of the others
+        def request(endpoint, method, params, files, headers=None):
+            calls.append(endpoint)
+            if endpoint == '/video/x5':
+                raise KeyError('id')
+            return {}
+        d.request = request
+        del calls[:]
+        endpoints = ['/video/x%d' % i for i in range(200)]
+        reports = d.bulk_delete(endpoints, workers=8, checkpoint=checkpoint)
+        self.assertEqual(len(calls), 200)
+        self.assertEqual([r['endpoint'] for r in reports if r['status'] == 'error'], ['/video/x5'])
+        with open(checkpoint) as f:
+            self.assertEqual(len(f.readlines()), 199)
+        os.remove(checkpoint)
+
+        del calls[:]
+        self.assertRaises(dailymotion.DailymotionClientError, d.bulk_delete, ['/video/x1'], workers=-1)
+        self.assertRaises(dailymotion.DailymotionClientError, d.bulk_delete, ['/video/x1'], workers=0)
+        bad_checkpoint = os.path.join(self.session_file_directory, 'missing', 'bulk.log')
+        self.assertRaises(IOError, d.bulk_delete, endpoints, checkpoint=bad_checkpoint)
+        self.assertEqual(calls, [])
+
+    @pytest.mark.skipif(httpx is None, reason="requires httpx")
+    def test_http2_transport(self):
+        requests_seen = []
+        def handler(request):
+            requests_seen.append(request)
+            return httpx.Response(200, json={'id': 'x1'})
+        d = dailymotion.Dailymotion(http2=True)
+        d._create_http2_client = lambda: httpx.Client(transport=httpx.MockTransport(handler))
+        self.assertEqual(d.get('/video/x1', {'fields': 'id'}), {'id': 'x1'})
+        self.assertEqual(d.delete('/video/x1'), {'id': 'x1'})
+        self.assertEqual(str(requests_seen[0].url), 'https://api.dailymotion.com/video/x1?fields=id')
+        self.assertEqual(requests_seen[1].method, 'DELETE')
+        client = d._http2_client
+        d.close()
+        self.assertTrue(client.is_closed)
+        self.assertIsNone(d._http2_client)
+
+        # httpx installed without h2
+        def client_without_h2(*args, **kwargs):
+            raise ImportError('Using http2=True, but the \'h2\' package is not installed.')
+        httpx_client, httpx.Client = httpx.Client, client_without_h2
+        try:
+            d = dailymotion.Dailymotion(http2=True)
+            self.assertRaises(dailymotion.DailymotionClientError, d.get, '/video/x1')
+        finally:
+            httpx.Client = httpx_client
+
+    @pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python3.5 or higher")
+    def test_xupload_chunk_retry(self):
+        import xupload
+        from xupload_test_server import FlakyUploadServer
+
+        class TestXupload(xupload.Xupload):
+            _CHUNK_SIZE = 1024
+            _RETRY_BACKOFF = 0
+
+        file_path = os.path.join(self.session_file_directory, 'chunks.bin')
+        content = os.urandom(4096)
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        server = FlakyUploadServer(len(content))
+        server.start()
+        try:
+            x = TestXupload(server.url, file_path, workers=2)
+            result = x.start()
+        finally:
+            server.stop()
+            os.remove(file_path)
+        self.assertEqual(result, {'url': 'http://upload/x1'})
+        self.assertEqual(b''.join(d for _, d in sorted(server.received.items())), content)
+        self.assertEqual(len(server.attempts), 12)
+        # the chunks in flight share the uplink: the budget of a chunk grows with the number of workers
+        self.assertEqual(x._get_chunk_timeout(1 << 20).total, 10 + 2 * 16)
+        self.assertEqual(x._get_chunk_timeout(1 << 20).sock_read, 60)
+
+    @pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python3.5 or higher")
+    def test_xupload_send_stall(self):
+        import xupload
+        from xupload_test_server import StalledUploadServer
+
+        class TestXupload(xupload.Xupload):
+            _CHUNK_SIZE = 32 << 20
+            _SEND_IDLE_TIMEOUT = 1
+            _CHUNK_RETRIES = 1
+            _RETRY_BACKOFF = 0
+
+        file_path = os.path.join(self.session_file_directory, 'stall.bin')
+        with open(file_path, 'wb') as f:
+            f.write(os.urandom(32 << 20))
+        server = StalledUploadServer()
+        server.start()
+        try:
+            x = TestXupload(server.url, file_path)
+            started = time.time()
+            with self.assertRaises(xupload.DailymotionXuploadError) as raised:
+                x.start()
+            elapsed = time.time() - started
+        finally:
+            server.stop()
+            os.remove(file_path)
+        # the stall is caught by the send progress timeout, long before the chunk's total budget
+        self.assertIn('No upload progress', str(raised.exception))
+        self.assertEqual(server.requests, 2)
+        self.assertLess(elapsed, 10)
+
+    @pytest.mark.skipif(sys.version_info < (3, 5), reason="requires python3.5 or higher")
+    def test_xupload_prepare_files(self):
+        import hashlib
+        import xupload
+
+        file_paths = []
+        for size in (1000, 20 << 20):
+            file_path = os.path.join(self.session_file_directory, '%d.bin' % size)
+            with open(file_path, 'wb') as f:
+                f.write(os.urandom(size))
+            file_paths.append(file_path)
+        try:
+            plans = xupload.prepare_files(file_paths, workers=4, processes=2)
+            for file_path, plan in zip(file_paths, plans):
+                with open(file_path, 'rb') as f:
+                    self.assertEqual(plan['sha1'], hashlib.sha1(f.read()).hexdigest())
+                self.assertEqual(plan['path'], file_path)
+                planned = xupload.Xupload('http://upload', file_path, plan=plan)
+                computed = xupload.Xupload('http://upload', file_path, workers=4)
+                self.assertEqual(planned._clients, computed._clients)
+                self.assertEqual(planned._chunk_size, computed._chunk_size)
+            self.assertEqual(plans[1]['workers'], 4)
+            self.assertEqual(plans[1]['ranges'][-1][1], (20 << 20) - 1)
+            self.assertEqual(sorted(plans[1]['checksums']), [offset for offset, _ in xupload.iter_chunks(plans[1])])
+
+            # a file modified after its plan was prepared is rejected
+            import asyncio
+            x = xupload.Xupload('http://upload', file_paths[1], plan=plans[1])
+            client = x._clients[1]
+            client['size'] = x._chunk_size
+            with open(file_paths[1], 'r+b') as f:
+                f.seek(client['offset'])
+                f.write(b'x')
+            loop = asyncio.new_event_loop()
+            try:
+                self.assertRaises(xupload.DailymotionXuploadError, loop.run_until_complete, x._read_chunk(client))
+                client = x._clients[0]
+                client['size'] = x._chunk_size
+                self.assertEqual(len(loop.run_until_complete(x._read_chunk(client))), x._chunk_size)
+            finally:
+                loop.close()
+            with open(file_paths[0], 'ab') as f:
+                f.write(b'x')
+            self.assertRaises(xupload.DailymotionXuploadError, xupload.Xupload, 'http://upload', file_paths[0], plan=plans[0])
+        finally:
+            for file_path in file_paths:
+                os.remove(file_path)
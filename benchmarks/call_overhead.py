@@ -0,0 +1,79 @@
+""" Per-call client overhead of Dailymotion.call, with the network stubbed out.
+
+Usage:
+    $ python benchmarks/call_overhead.py [--calls N] [--store memory|file]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import dailymotion
+
+
+class FakeResponse(object):
+    status_code = 200
+    headers = {}
+
+    def json(self):
+        return {'list': [], 'has_more': False}
+
+
+class FakeTransport(object):
+    """ Stands in for the requests module so only client-side work is measured. """
+    exceptions = dailymotion.requests.exceptions
+
+    def __init__(self):
+        self._response = FakeResponse()
+
+    def get(self, url, **kwargs):
+        return self._response
+
+    post = delete = get
+
+
+def make_client(store):
+    d = dailymotion.Dailymotion(session_store=store)
+    d.set_grant_type('password', api_key='key', api_secret='secret',
+        info={'username': 'bench', 'password': 'bench'})
+    store.set({
+        'access_token': 'token',
+        'expires': int(time.time() + 3600),
+        'refresh_token': None,
+        'scope': [],
+    })
+    return d
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=100000)
+    parser.add_argument('--store', choices=('memory', 'file'), default='memory')
+    args = parser.parse_args()
+
+    directory = None
+    if args.store == 'file':
+        directory = tempfile.mkdtemp()
+        store = dailymotion.FileSessionStore(directory)
+    else:
+        store = dailymotion.SessionStore()
+
+    dailymotion.requests = FakeTransport()
+    try:
+        d = make_client(store)
+        elapsed = timeit.timeit(lambda: d.get('/videos'), number=args.calls)
+    finally:
+        if directory:
+            shutil.rmtree(directory)
+
+    print('%s store: %d calls in %.3fs (%.2f us/call)' % (
+        args.store, args.calls, elapsed, elapsed / args.calls * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+""" HTTP/1.1 vs HTTP/2 transport: concurrent API calls against a local stand-in server.
+
+Requires httpx[http2] and hypercorn. The stand-in speaks cleartext HTTP/2 (h2c), so the client below
+uses HTTP/2 with prior knowledge instead of TLS/ALPN negotiation.
+
+Usage:
+    $ python benchmarks/http2_transport.py [--calls N] [--workers N] [--latency MS]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import httpx
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+
+import dailymotion
+
+
+class StandInServer(object):
+    """ ASGI app answering every API call with the same small JSON payload. """
+
+    def __init__(self, latency):
+        self._latency = latency
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+
+        while True:
+            message = await receive()
+            if not message.get('more_body'):
+                break
+
+        if self._latency:
+            await asyncio.sleep(self._latency)
+
+        content = {'id': 'x1', 'list': [], 'has_more': False}
+        payload = json.dumps(content).encode('utf8')
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+
+class H2cDailymotion(dailymotion.Dailymotion):
+
+    def _create_http2_client(self):
+        return httpx.Client(http1=False, http2=True, timeout=self.timeout)
+
+
+def start_server(app):
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    config = Config()
+    config.bind = ['127.0.0.1:%d' % port]
+    config.loglevel = 'WARNING'
+
+    async def run():
+        # an explicit shutdown trigger keeps hypercorn from installing signal handlers outside the main thread
+        await serve(app, config, shutdown_trigger=asyncio.Event().wait)
+
+    threading.Thread(target=asyncio.run, args=(run(),), daemon=True).start()
+
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return 'http://127.0.0.1:%d' % port
+
+
+def bench_calls(base_url, http2, calls, workers):
+    cls = H2cDailymotion if http2 else dailymotion.Dailymotion
+    d = cls(api_base_url=base_url, http2=http2)
+    started = time.time()
+    reports = d.bulk_post([('/video/x1', {'title': 'bench'})] * calls, workers=workers)
+    elapsed = time.time() - started
+    assert all(r['status'] == 'done' for r in reports), reports[0]
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=5, help='server side latency, in ms')
+    args = parser.parse_args()
+
+    base_url = start_server(StandInServer(args.latency / 1000.0))
+
+    for http2 in (False, True):
+        elapsed = bench_calls(base_url, http2, args.calls, args.workers)
+        print('%s API calls: %d calls in %.3fs (%.1f calls/s)' % (
+            'HTTP/2  ' if http2 else 'HTTP/1.1', args.calls, elapsed, args.calls / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+""" Cold import time of the dailymotion module, measured with `python -X importtime`.
+
+Fails (exit code 1) if the upload/async stack is imported eagerly, or if the import is slower
+than --max-ms.
+
+Usage:
+    $ python benchmarks/import_time.py [--runs N] [--max-ms MS]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# only needed by Dailymotion.upload(), must not be loaded by `import dailymotion`
+LAZY_MODULES = ('xupload', 'aiohttp', 'aiofiles', 'asyncio', 'requests_toolbelt')
+
+IMPORT_TIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$')
+
+
+def measure():
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import dailymotion'],
+        cwd=ROOT, stderr=subprocess.STDOUT, universal_newlines=True
+    )
+    cumulative, modules = None, set()
+    for line in output.splitlines():
+        m = IMPORT_TIME_RE.match(line)
+        if not m:
+            continue
+        modules.add(m.group(4).split('.')[0])
+        if m.group(4) == 'dailymotion':
+            cumulative = int(m.group(2))
+    return cumulative, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    timings, modules = [], set()
+    for _ in range(args.runs):
+        cumulative, imported = measure()
+        timings.append(cumulative)
+        modules |= imported
+
+    best = min(timings) / 1000.0
+    print('import dailymotion: best %.1fms over %d runs' % (best, args.runs))
+
+    errors = []
+    eager = sorted(set(LAZY_MODULES) & modules)
+    if eager:
+        errors.append('eagerly imported: %s' % ', '.join(eager))
+    if args.max_ms is not None and best > args.max_ms:
+        errors.append('import time %.1fms exceeds %.1fms' % (best, args.max_ms))
+
+    for error in errors:
+        print('FAIL: %s' % error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+""" Incremental mirroring of a video list endpoint into a local SQLite index """
+import hashlib
+import json
+import sqlite3
+import time
+
+from dailymotion import DailymotionApiError
+
+
+class CatalogSync(object):
+    """
+    Keeps a local index (id, updated_time, content hash) of a list endpoint such as `/user/<id>/videos`
+    and only fetches the items updated since the last run:
+
+        sync = CatalogSync(dm, '/user/x2abc/videos', 'catalog.db', fields=('id', 'title', 'updated_time'))
+        for event, item in sync.run():
+            ...
+
+    Events are ('created', item), ('updated', item) and ('deleted', {'id': ...}). Deleted items are not
+    returned by the incremental query, they are detected by a full (id only) scan: `run(full=True)`.
+
+    The API can't sort by update time, so lists are walked by creation time with keyset paging: each page
+    starts after the last creation time seen, and items updated or deleted during the walk don't shift the
+    pages. Items updated during the walk may still be passed over, so the watermark never moves past the
+    time the walk started (minus CLOCK_SKEW): the next run fetches them again.
+    """
+
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+
+    DEFAULT_FIELDS = ('id', 'created_time', 'updated_time')
+    ITEM_ENDPOINT = '/video/%s'
+    CLOCK_SKEW = 300
+
+    def __init__(self, client, endpoint, db_path=':memory:', fields=None):
+        self._client = client
+        self._endpoint = endpoint
+        self._fields = tuple(fields or self.DEFAULT_FIELDS)
+        for field in self.DEFAULT_FIELDS:
+            if field not in self._fields:
+                self._fields += (field,)
+        self._db = sqlite3.connect(db_path)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            ' endpoint TEXT NOT NULL, id TEXT NOT NULL, updated_time INTEGER NOT NULL, hash TEXT NOT NULL,'
+            ' PRIMARY KEY (endpoint, id))'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS state (endpoint TEXT PRIMARY KEY, watermark INTEGER NOT NULL)'
+        )
+        self._db.commit()
+
+    @property
+    def watermark(self):
+        row = self._db.execute('SELECT watermark FROM state WHERE endpoint = ?', (self._endpoint,)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self._db.close()
+
+    @staticmethod
+    def _hash(item):
+        return hashlib.sha1(json.dumps(item, sort_keys=True).encode('utf8')).hexdigest()
+
+    def _query(self, fields):
+        return self._client.query(self._endpoint).only(*fields).limit(100).filter(sort='old')
+
+    def _walk(self, query):
+        """ Yield the items of `query` (sorted by creation time) page after page, with keyset paging """
+        cursor, page = None, 1
+        while True:
+            keyset = query if cursor is None else query.filter(created_after=cursor - 1)
+            result = keyset.get(page)
+            items = result.get('list', [])
+            yield items
+            if not result.get('has_more') or not items:
+                return
+            last = int(items[-1]['created_time'])
+            if last == cursor:
+                # a whole page created within the same second: move on within that second
+                page += 1
+            else:
+                cursor, page = last, 1
+
+    def run(self, full=False):
+        """
+        Yield the changes since the previous run and update the local index accordingly. An item is only
+        recorded once the consumer got back from handling it, and the watermark only moves forward once
+        the whole change set was consumed, so an interrupted run is replayed from the first unhandled item.
+        """
+        started = int(time.time()) - self.CLOCK_SKEW
+        watermark = self.watermark
+        query = self._query(self._fields)
+        if watermark is not None:
+            # same-second updates may land on either side of the watermark, the hash check filters them
+            query = query.filter(updated_after=watermark - 1)
+
+        latest = watermark or 0
+        for items in self._walk(query):
+            for item in items:
+                latest = max(latest, int(item['updated_time']))
+                digest = self._hash(item)
+                event = self._diff(item, digest)
+                if event:
+                    yield event, item
+                    self._store(item, digest)
+            self._db.commit()
+
+        if full:
+            for event in self._deleted():
+                yield event
+
+        # an item updated during the walk may have been passed over: keep the watermark before it
+        latest = min(latest, max(started, watermark or 0))
+        self._db.execute('INSERT OR REPLACE INTO state (endpoint, watermark) VALUES (?, ?)', (self._endpoint, latest))
+        self._db.commit()
+
+    def _diff(self, item, digest):
+        row = self._db.execute(
+            'SELECT hash FROM items WHERE endpoint = ? AND id = ?', (self._endpoint, item['id'])
+        ).fetchone()
+        if row is None:
+            return self.CREATED
+        if row[0] != digest:
+            return self.UPDATED
+        return None
+
+    def _store(self, item, digest):
+        self._db.execute(
+            'INSERT OR REPLACE INTO items (endpoint, id, updated_time, hash) VALUES (?, ?, ?, ?)',
+            (self._endpoint, item['id'], int(item['updated_time']), digest)
+        )
+
+    def _deleted(self):
+        # the whole list is walked before anything is deleted: a failed walk raises and deletes nothing
+        remote = set()
+        for items in self._walk(self._query(('id', 'created_time'))):
+            remote.update(item['id'] for item in items)
+        local = [row[0] for row in self._db.execute('SELECT id FROM items WHERE endpoint = ?', (self._endpoint,))]
+        for video_id in local:
+            if video_id not in remote and not self._exists(video_id):
+                yield self.DELETED, {'id': video_id}
+                self._db.execute('DELETE FROM items WHERE endpoint = ? AND id = ?', (self._endpoint, video_id))
+        self._db.commit()
+
+    def _exists(self, video_id):
+        """ Missing from the list isn't enough to report a deletion: the item itself must be gone """
+        try:
+            self._client.get(self.ITEM_ENDPOINT % video_id, {'fields': 'id'})
+        except DailymotionApiError as e:
+            if e.type == 'not_found':
+                return False
+            raise
+        return True
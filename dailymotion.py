@@ -1,7 +1,7 @@
 """ Dailymotion SDK """
 import requests
-from requests_toolbelt import MultipartEncoder
 import time
+import threading
 import os
 import sys
 import re
@@ -25,10 +25,19 @@ except ImportError:  # Python 2
     except ImportError:  # Python < 2.6
         from cgi import parse_qsl
 
-if sys.version_info > (3, 5):
-    import xupload
-else:  # Python < 3.5
-    xupload = None
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+
+def _import_xupload():
+    # xupload pulls aiohttp/asyncio in, only load it for parallel uploads
+    if sys.version_info > (3, 5):
+        import xupload
+        return xupload
+    return None  # Python < 3.5
+
 
 class DailymotionClientError(Exception):
     def __init__(self, message, error_type=None):
@@ -141,6 +150,83 @@ class FileSessionStore(object):
         self._remove()
 
 
+class Query(object):
+    """
+    Immutable query on a list endpoint which always sends an explicit `fields` selection:
+
+        dm.videos.filter(owner='x2abc').only('id', 'title').iter()
+    """
+
+    DEFAULT_FIELDS  = ('id',)
+    MAX_LIMIT       = 100
+
+    def __init__(self, client, endpoint, fields=None, filters=None, limit=None):
+        self._client    = client
+        self._endpoint  = endpoint
+        self._fields    = tuple(fields) if fields else self.DEFAULT_FIELDS
+        self._filters   = dict(filters or {})
+        self._limit     = limit
+
+        # the query is immutable: its parameters are built once, only the page changes
+        self._params            = dict(self._filters)
+        self._params['fields']  = ','.join(self._fields)
+        if self._limit:
+            self._params['limit'] = self._limit
+
+    def _copy(self, **kwargs):
+        state = {'fields': self._fields, 'filters': self._filters, 'limit': self._limit}
+        state.update(kwargs)
+        return Query(self._client, self._endpoint, **state)
+
+    def filter(self, **filters):
+        merged = dict(self._filters)
+        merged.update(filters)
+        return self._copy(filters=merged)
+
+    def only(self, *fields):
+        if not fields:
+            raise DailymotionClientError('At least one field must be selected')
+        return self._copy(fields=fields)
+
+    def limit(self, limit):
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise DailymotionClientError('Invalid limit: %r' % (limit,))
+        if not 0 < limit <= self.MAX_LIMIT:
+            raise DailymotionClientError('Limit must be between 1 and %d' % self.MAX_LIMIT)
+        return self._copy(limit=limit)
+
+    @property
+    def fields(self):
+        return self._params['fields']
+
+    def params(self, page=None):
+        params = dict(self._params)
+        if page:
+            params['page'] = page
+        return params
+
+    def get(self, page=None):
+        return self._client.get(self._endpoint, self.params(page))
+
+    def pages(self):
+        page = 1
+        while True:
+            result = self.get(page)
+            yield result
+            if not result.get('has_more'):
+                break
+            page += 1
+
+    def iter(self):
+        for result in self.pages():
+            for item in result.get('list', []):
+                yield item
+
+    __iter__ = iter
+
+
 class Dailymotion(object):
 
     DEFAULT_DEBUG           = False
@@ -149,8 +235,10 @@ class Dailymotion(object):
     DEFAULT_AUTHORIZE_URL   = 'https://www.dailymotion.com/oauth/authorize'
     DEFAULT_TOKEN_URL       = 'https://api.dailymotion.com/oauth/token'
     DEFAULT_SESSION_STORE   = True
+    DEFAULT_BULK_WORKERS    = 8
+    DEFAULT_HTTP2           = False
 
-    def __init__(self, api_base_url=None, debug=None, timeout=None, oauth_authorize_endpoint_url=None, oauth_token_endpoint_url=None, session_store_enabled=None, session_store=None):
+    def __init__(self, api_base_url=None, debug=None, timeout=None, oauth_authorize_endpoint_url=None, oauth_token_endpoint_url=None, session_store_enabled=None, session_store=None, http2=None):
 
         self.api_base_url                   = api_base_url or self.DEFAULT_API_BASE_URL
         self.debug                          = debug or self.DEFAULT_DEBUG
@@ -163,6 +251,13 @@ class Dailymotion(object):
                                                 'User-Agent' : 'Dailymotion-Python/%s (Python %s)' % (__version__, __python_version__)}
         self._session_store_enabled         = self.DEFAULT_SESSION_STORE if session_store_enabled is None else session_store_enabled
         self._session_store                 = SessionStore() if session_store is None else session_store
+        self._auth_headers                  = None
+        self._auth_expires                  = 0
+        self._auth_lock                     = threading.Lock()
+        self._token_expires                 = None
+        self._http2                         = self.DEFAULT_HTTP2 if http2 is None else http2
+        self._http2_client                  = None
+        self._http2_lock                    = threading.Lock()
 
 
     def set_grant_type(self, grant_type = 'client_credentials', api_key=None, api_secret=None, scope=None, info=None):
@@ -185,6 +280,8 @@ class Dailymotion(object):
             MUST NOT be stored by the client.
         """
 
+        self._reset_auth_headers()
+
         if api_key and api_secret:
             self._grant_info['key'] = api_key
             self._grant_info['secret'] = api_secret
@@ -250,11 +347,14 @@ class Dailymotion(object):
             'scope': result['scope'] if 'scope' in result else [],
             }
 
+        self._reset_auth_headers()
+        self._token_expires = result['expires']
         if self._session_store_enabled and self._session_store != None:
             self._session_store.set(result)
         return result
 
     def set_access_token(self, access_token):
+        self._reset_auth_headers()
         self._session_store.set_value('access_token', access_token)
 
     def get_access_token(self, force_refresh=False, request_args=None):
@@ -312,8 +412,25 @@ class Dailymotion(object):
         response = self.oauth_token_request(params)
         return response.get('access_token')
 
+    def close(self):
+        """
+        Release the connections of the HTTP/2 transport, if it was used.
+        """
+        with self._http2_lock:
+            if self._http2_client is not None:
+                self._http2_client.close()
+                self._http2_client = None
+
+    def query(self, endpoint):
+        return Query(self, endpoint)
+
+    @property
+    def videos(self):
+        return self.query('/videos')
+
     def logout(self):
         self.call('/logout')
+        self._reset_auth_headers()
         self._session_store.clear()
 
     def get(self, endpoint, params=None):
@@ -325,20 +442,155 @@ class Dailymotion(object):
     def delete(self, endpoint, params=None):
         return self.call(endpoint, method='DELETE', params=params)
 
+    def bulk_post(self, items, workers=None, checkpoint=None):
+        """
+        POST many (endpoint, params) items on a bounded thread pool, see `_bulk`.
+        """
+        return self._bulk('POST', items, workers, checkpoint)
+
+    def bulk_delete(self, endpoints, workers=None, checkpoint=None):
+        """
+        DELETE many endpoints on a bounded thread pool, see `_bulk`.
+        """
+        return self._bulk('DELETE', [(endpoint, None) for endpoint in endpoints], workers, checkpoint)
+
+    def _bulk(self, method, items, workers=None, checkpoint=None):
+        """
+        Run the calls with at most `workers` requests in flight, all sharing the client's access token.
+        Returns one report per item, in the input order:
+            {'endpoint': ..., 'params': ..., 'status': 'done' | 'error' | 'skipped', 'result' | 'error': ...}
+        `checkpoint` is the path of a file where each successful call is recorded: running the same job
+        again with it skips the calls already done, so only the failed or missing ones are sent.
+        """
+        workers = self.DEFAULT_BULK_WORKERS if workers is None else workers
+        if workers < 1:
+            raise DailymotionClientError('Invalid number of workers: %r (must be >= 1)' % (workers,))
+
+        items = [(endpoint, params) for endpoint, params in items]
+        keys = [json.dumps([method, endpoint, params], sort_keys=True) for endpoint, params in items]
+
+        done = set()
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                done = set(line.rstrip('\n') for line in f if line.strip())
+
+        def run(item):
+            endpoint, params = item
+            try:
+                return {'endpoint': endpoint, 'params': params, 'status': 'done',
+                        'result': self.call(endpoint, method=method, params=params)}
+            except Exception as e:
+                return {'endpoint': endpoint, 'params': params, 'status': 'error', 'error': e}
+
+        # warm up the token before fanning out
+        self._get_auth_headers()
+
+        reports = [None] * len(items)
+        todo = queue.Queue()
+        for index, (item, key) in enumerate(zip(items, keys)):
+            if key in done:
+                reports[index] = {'endpoint': item[0], 'params': item[1], 'status': 'skipped'}
+            else:
+                todo.put(index)
+
+        results = queue.Queue()
+        stop = threading.Event()
+
+        def worker():
+            while not stop.is_set():
+                try:
+                    index = todo.get_nowait()
+                except queue.Empty:
+                    return
+                results.put((index, run(items[index])))
+
+        # opened before any call is sent, so a bad checkpoint path fails the job without mutating anything
+        log = open(checkpoint, 'a') if checkpoint else None
+
+        remaining = todo.qsize()
+        threads = [threading.Thread(target=worker) for _ in range(min(workers, remaining))]
+
+        def record(index, report):
+            reports[index] = report
+            if log and report['status'] == 'done':
+                log.write(keys[index] + '\n')
+                log.flush()
+
+        try:
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            while remaining > 0:
+                try:
+                    # a timeout keeps the wait interruptible (KeyboardInterrupt) on Python 2
+                    index, report = results.get(timeout=1)
+                except queue.Empty:
+                    continue
+                record(index, report)
+                remaining -= 1
+        finally:
+            # on abort, don't start new calls, and checkpoint the ones which were in flight
+            stop.set()
+            for thread in threads:
+                if thread.ident is not None:  # started
+                    thread.join()
+            while not results.empty():
+                record(*results.get_nowait())
+            if log:
+                log.close()
+
+        return reports
+
     def call(self, endpoint, method='GET', params=None, files=None):
+        headers = self._get_auth_headers()
         try:
-            access_token = self.get_access_token()
-            if access_token:
-                self._headers['Authorization'] = 'Bearer %s' % access_token
-            return self.request(endpoint, method, params, files)
+            return self.request(endpoint, method, params, files, headers=headers)
         except DailymotionTokenExpired:
-            access_token = 'Bearer %s' % self.get_access_token(True)
-            if access_token:
-                self._headers['Authorization'] = 'Bearer %s' % access_token
+            return self.request(endpoint, method, params, files, headers=self._get_auth_headers(rejected=headers))
 
-        return self.request(endpoint, method, params, files)
+    def _get_auth_headers(self, rejected=None):
+        """
+        Return the request headers carrying the bearer token. The headers are cached on the client
+        until the token expires, so steady-state calls don't touch the session store.
+        `rejected` are headers whose token was refused by the API: a new token is then requested,
+        unless another thread already did it.
+        """
+        headers = self._auth_headers
+        if headers is not None and headers is not rejected and time.time() < self._auth_expires:
+            return headers
+
+        with self._auth_lock:
+            headers = self._auth_headers
+            if headers is not None and headers is not rejected and time.time() < self._auth_expires:
+                return headers
+
+            # set by oauth_token_request when a new token is issued, whether the session store is enabled or not
+            self._token_expires = None
+            access_token = self.get_access_token(rejected is not None)
+            if not access_token:
+                return self._headers
+
+            headers = dict(self._headers)
+            headers['Authorization'] = 'Bearer %s' % access_token
+            if self._token_expires is not None:
+                self._auth_expires = self._token_expires
+            elif self._session_store_enabled:
+                self._auth_expires = self._session_store.get_value('expires', 0)
+            else:
+                self._auth_expires = 0
+            self._auth_headers = headers
+            return headers
 
-    def upload(self, file_path, progress=None, workers=0):
+    def _reset_auth_headers(self):
+        self._auth_headers = None
+        self._auth_expires = 0
+
+    def upload(self, file_path, progress=None, workers=0, plan=None):
+        """
+        `plan` is a chunk plan prepared ahead by `xupload.prepare_files`: when given, the file is sent
+        in parallel chunks by xupload, with the plan's number of workers, and each chunk is checked
+        against the plan's checksums.
+        """
         if not os.path.exists(file_path):
             raise IOError("[Errno 2] No such file or directory: '%s'" % file_path)
 
@@ -352,16 +604,20 @@ class Dailymotion(object):
             'User-Agent': 'Dailymotion-Python/%s (Python %s)' % (__version__, __python_version__)
         }
 
-        if workers > 0 and xupload:
+        xupload = _import_xupload() if workers > 0 or plan else None
+        if xupload:
             x = xupload.Xupload(
                 result['upload_url'],
                 file_path,
                 workers=workers,
                 headers=headers,
-                progress=progress
+                progress=progress,
+                plan=plan
             )
             response = x.start()
         else:
+            from requests_toolbelt import MultipartEncoder
+
             m = MultipartEncoder(fields={'file': (os.path.basename(file_path), open(file_path, 'rb'))})
             headers['Content-Type'] = m.content_type
 
@@ -377,31 +633,16 @@ class Dailymotion(object):
 
         return response['url']
 
-    def request(self, endpoint, method='GET', params=None, files=None):
-        params = params or {}
-
-        if endpoint.find('http') == 0:
-            url = endpoint
-        else:
-            if endpoint.find('/') != 0:
-                raise DailymotionClientError('Endpoint must start with / (eg:/me/video)')
-            url = '%s%s' % (self.api_base_url, endpoint)
-
-        method = method.lower()
-
-        if not method in ('get', 'post', 'delete'):
-            raise DailymotionClientError('Method must be of GET, POST or DELETE')
-
+    def _http1_request(self, url, method, params, files, headers):
         func = getattr(requests, method)
         try:
             if method == 'get':
-                response = func(url, params=params, headers=self._headers, timeout=self.timeout)
-            else:
-                response = func(url,
-                                data=params,
-                                files=files,
-                                headers=self._headers,
-                                timeout=self.timeout)
+                return func(url, params=params, headers=headers, timeout=self.timeout)
+            return func(url,
+                        data=params,
+                        files=files,
+                        headers=headers,
+                        timeout=self.timeout)
 
         except requests.exceptions.ConnectionError:
             raise DailymotionClientError('Network problem (DNS failure, refused connection...).')
@@ -414,6 +655,64 @@ class Dailymotion(object):
         except requests.exceptions.RequestException:
             raise DailymotionClientError('An unknown error occurred.')
 
+    def _create_http2_client(self):
+        try:
+            import httpx
+            # raises ImportError as well when httpx is installed without h2
+            return httpx.Client(http2=True, timeout=self.timeout, follow_redirects=True)
+        except ImportError:
+            raise DailymotionClientError('The HTTP/2 transport requires httpx and h2: pip install "httpx[http2]"')
+
+    def _get_http2_client(self):
+        """
+        All the calls of the client (including the ones from other threads) are multiplexed
+        over one HTTP/2 connection per host.
+        """
+        if self._http2_client is None:
+            with self._http2_lock:
+                if self._http2_client is None:
+                    self._http2_client = self._create_http2_client()
+        return self._http2_client
+
+    def _http2_request(self, url, method, params, files, headers):
+        client = self._get_http2_client()
+        import httpx
+
+        try:
+            if method == 'get':
+                return client.get(url, params=params, headers=headers)
+            return client.request(method.upper(), url, data=params, files=files, headers=headers)
+
+        except httpx.TimeoutException:
+            raise DailymotionApiError('The request times out, current timeout is = %s' % self.timeout)
+        except httpx.TooManyRedirects:
+            raise DailymotionApiError('The request exceeds the configured number of maximum redirections')
+        except httpx.TransportError:
+            raise DailymotionClientError('Network problem (DNS failure, refused connection...).')
+        except httpx.HTTPError:
+            raise DailymotionClientError('An unknown error occurred.')
+
+    def request(self, endpoint, method='GET', params=None, files=None, headers=None):
+        params = params or {}
+        headers = headers or self._headers
+
+        if endpoint.find('http') == 0:
+            url = endpoint
+        else:
+            if endpoint.find('/') != 0:
+                raise DailymotionClientError('Endpoint must start with / (eg:/me/video)')
+            url = '%s%s' % (self.api_base_url, endpoint)
+
+        method = method.lower()
+
+        if not method in ('get', 'post', 'delete'):
+            raise DailymotionClientError('Method must be of GET, POST or DELETE')
+
+        if self._http2:
+            response = self._http2_request(url, method, params, files, headers)
+        else:
+            response = self._http1_request(url, method, params, files, headers)
+
         try:
             content = response.json if isinstance(response.json, dict) else response.json()
         except ValueError:
@@ -22,7 +22,7 @@ setup(name='dailymotion',
       license='Apache License, Version 2.0',
       include_package_data=True,
       zip_safe=False,
-      py_modules = ['dailymotion','xupload'],
+      py_modules = ['dailymotion','xupload','catalogsync'],
       setup_requires=["wheel"],
       install_requires=[
           'requests',
@@ -31,4 +31,7 @@ setup(name='dailymotion',
           'aiofiles;python_version>"3.4"',
           'asyncio;python_version>"3.4"'
       ],
+      extras_require={
+          'http2': ['httpx[http2]'],
+      },
 )
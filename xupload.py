@@ -1,108 +1,269 @@
 import aiohttp
 import aiofiles
 import asyncio
+import hashlib
+import itertools
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+class DailymotionXuploadError(Exception):
+    pass
+
+
+def plan_chunks(file_size, workers=1, max_chunk_size=4 << 20):
+    """
+    Split a file in one byte range per worker, each range being sent in chunks of `chunk_size` bytes
+    :return: dict with the file `size`, the number of `workers`, the `chunk_size` and the `ranges`
+    """
+    workers = int(max(1, min(workers, file_size / max_chunk_size, 8)))
+    chunk_size = file_size / workers
+    chunk_size = (
+        int(chunk_size / int(chunk_size / max_chunk_size))
+        if int(chunk_size / max_chunk_size) > 0
+        else int(chunk_size)
+    )
+    chunks = int(round(file_size / chunk_size / workers))
+
+    ranges = []
+    for index in range(workers):
+        start = index * chunk_size * chunks
+        end = (
+            file_size - 1
+            if index == workers - 1
+            else ((index + 1) * chunk_size * chunks) - 1
+        )
+        ranges.append([start, end])
+
+    return {
+        'size': file_size,
+        'workers': workers,
+        'chunk_size': chunk_size,
+        'ranges': ranges,
+    }
+
+
+def iter_chunks(plan):
+    """
+    Yield the (offset, size) of every chunk of a plan, in the file order
+    """
+    for start, end in plan['ranges']:
+        offset = start
+        while offset <= end:
+            size = min(plan['chunk_size'], end - offset + 1)
+            yield offset, size
+            offset += size
+
+
+def prepare_file(file_path, workers=1, max_chunk_size=4 << 20):
+    """
+    Plan the chunks of a file (see `plan_chunks`) and compute, in a single read, the SHA1 checksum
+    of the file and of each chunk. Xupload checks every chunk it sends against these checksums, so
+    a file modified between its preparation and its upload is rejected.
+    :return: the chunk plan, with the file `path`, its `sha1` and the chunk `checksums` by offset
+    """
+    plan = plan_chunks(os.stat(file_path).st_size, workers, max_chunk_size)
+    sha1 = hashlib.sha1()
+    checksums = {}
+    with open(file_path, 'rb') as f:
+        for offset, size in iter_chunks(plan):
+            data = f.read(size)
+            sha1.update(data)
+            checksums[offset] = hashlib.sha1(data).hexdigest()
+
+    plan['path'] = file_path
+    plan['sha1'] = sha1.hexdigest()
+    plan['checksums'] = checksums
+    return plan
+
+
+def prepare_files(file_paths, workers=1, max_chunk_size=4 << 20, processes=None):
+    """
+    Run `prepare_file` for many files on a process pool, ahead of their uploads. The plans are
+    returned in the order of `file_paths` and can be given to `Xupload(..., plan=plan)`.
+    """
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(
+            prepare_file,
+            file_paths,
+            itertools.repeat(workers),
+            itertools.repeat(max_chunk_size)
+        ))
+
+
+class _ChunkBody(object):
+    """
+    Request body sending a chunk in slices: aiohttp only asks for the next slice once the previous
+    one was taken by the connection, so `progress_at` tells when the upload last moved forward.
+    """
+
+    def __init__(self, data, slice_size, loop):
+        self._data = data
+        self._slice_size = slice_size
+        self._offset = 0
+        self._loop = loop
+        self.progress_at = loop.time()
+        self.done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self.progress_at = self._loop.time()
+        if self._offset >= len(self._data):
+            self.done = True
+            raise StopAsyncIteration
+        data = self._data[self._offset:self._offset + self._slice_size]
+        self._offset += len(data)
+        return data
 
 
 class Xupload(object):
 
     PROXY_SOCKET = ""
-    _QUERY_TIMEOUT = 60 * 60
     _CHUNK_SIZE = 4 << 20
+    # stalled connections are detected by inactivity timeouts: on connect, while the chunk is sent
+    # (no slice of _SEND_SLICE bytes taken by the connection) and while waiting for the response
+    _CONNECT_TIMEOUT = 10
+    _SEND_IDLE_TIMEOUT = 30
+    _SEND_SLICE = 64 << 10
+    _READ_TIMEOUT = 60
+    # the total budget of a chunk is _CHUNK_TIMEOUT seconds plus the time to send all the chunks
+    # in flight at _UPLINK_MIN_THROUGHPUT bytes/s, as they share the uplink
+    _CHUNK_TIMEOUT = 10
+    _UPLINK_MIN_THROUGHPUT = 64 << 10
+    _CHUNK_RETRIES = 5
+    _RETRY_BACKOFF = 1
 
-    def __init__(self, upload_url, file_path, workers=1, headers=None, progress=None):
+    def __init__(self, upload_url, file_path, workers=1, headers=None, progress=None, plan=None):
+        """
+        `plan` is the result of `prepare_file`/`prepare_files` for this file: the chunk boundaries
+        are then taken from it instead of being computed here, and each chunk is checked against
+        the plan's checksums before being sent.
+        """
         if not os.path.exists(file_path):
             raise IOError("[Errno 2] No such file or directory: '%s'" % file_path)
 
+        file_size = os.stat(file_path).st_size
+        if plan is None:
+            plan = plan_chunks(file_size, workers, self._CHUNK_SIZE)
+        elif plan['size'] != file_size:
+            raise DailymotionXuploadError(
+                'File {} changed since its upload plan was prepared'.format(file_path)
+            )
+
         self._url = upload_url
         self._file_path = file_path
-        self._file_size = os.stat(self._file_path).st_size
-        self._workers = int(max(1, min(workers, self._file_size / self._CHUNK_SIZE, 8)))
+        self._file_size = plan['size']
+        self._workers = plan['workers']
         self._headers = headers if isinstance(headers,dict) else {}
         self._progress = progress
-        self._chunk_size = self._file_size / self._workers
-        self._chunk_size = (
-            int(self._chunk_size / int(self._chunk_size / self._CHUNK_SIZE))
-            if int(self._chunk_size / self._CHUNK_SIZE) > 0
-            else int(self._chunk_size)
-        )
+        self._chunk_size = plan['chunk_size']
+        self._checksums = plan.get('checksums')
         self._session = None
         self._clients = []
         self._tasks = []
-        chunks = int(round(self._file_size / self._chunk_size / self._workers))
-
-        for index in range(self._workers):
-            start = index * self._chunk_size * chunks
-            end = (
-                self._file_size - 1
-                if index == self._workers - 1
-                else ((index + 1) * self._chunk_size * chunks) - 1
-            )
+
+        for start, end in plan['ranges']:
             self._clients.append({
                 'start': start,
                 'offset': start,
                 'end': end,
                 'size': 0,
-                'sent': 0
+                'sent': 0,
+                'resent': 0
             })
 
     def start(self):
-        loop = asyncio.get_event_loop()
-        result = loop.run_until_complete(self._run())
-        loop.run_until_complete(asyncio.sleep(0.250))
-        loop.close()
+        loop = asyncio.new_event_loop()
+        try:
+            result = loop.run_until_complete(self._run())
+            loop.run_until_complete(asyncio.sleep(0.250))
+        finally:
+            loop.close()
         return result
 
-    async def _prepare_handle(self, client):
+    async def _read_chunk(self, client):
         async with aiofiles.open(self._file_path, "rb") as file:
-            client['size'] = min(self._chunk_size, client['end'] - client['offset'] + 1)
-            client['data'] = await self._get_file_chunk(file, client['size'], client['offset'])
-            client['headers'] = {
-                **self._headers,
-                **{
-                    'Accept': '*/*',
-                    'Content-Type': 'application/octet-stream',
-                    'Content-Disposition': 'attachment; filename="{}"'.format(
-                        os.path.basename(self._file_path)
-                    ),
-                    'Content-Range': 'bytes {}-{}/{}'.format(
-                        client['offset'],
-                        client['offset'] + client['size'] - 1,
-                        self._file_size
+            data = await self._get_file_chunk(file, client['size'], client['offset'])
+
+        if self._checksums is not None:
+            checksum = await asyncio.get_event_loop().run_in_executor(
+                None, lambda: hashlib.sha1(data).hexdigest()
+            )
+            if checksum != self._checksums.get(client['offset']):
+                raise DailymotionXuploadError(
+                    'File {} changed since its upload plan was prepared (bytes {}-{})'.format(
+                        self._file_path, client['offset'], client['offset'] + client['size'] - 1
                     )
-                }
+                )
+        return data
+
+    async def _prepare_handle(self, client):
+        client['size'] = min(self._chunk_size, client['end'] - client['offset'] + 1)
+        client['data'] = await self._read_chunk(client)
+        client['resent'] = 0
+        client['headers'] = {
+            **self._headers,
+            **{
+                'Accept': '*/*',
+                'Content-Type': 'application/octet-stream',
+                'Content-Disposition': 'attachment; filename="{}"'.format(
+                    os.path.basename(self._file_path)
+                ),
+                'Content-Range': 'bytes {}-{}/{}'.format(
+                    client['offset'],
+                    client['offset'] + client['size'] - 1,
+                    self._file_size
+                )
             }
-            self._tasks.append(
-                asyncio.ensure_future(self._post_chunk(self._url, client))
-            )
+        }
+        self._tasks.append(
+            asyncio.ensure_future(self._post_chunk(self._url, client))
+        )
 
-    async def _run(self):
-        self._session = aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=self._QUERY_TIMEOUT),
+    def _create_session(self):
+        return aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=None),
             connector=aiohttp.TCPConnector(limit=self._workers)
         )
 
+    async def _run(self):
+        self._session = self._create_session()
+
         if self._progress:
             self._progress(0, self._file_size)
 
         async with self._session:
-            for client in self._clients:
-                await self._prepare_handle(client)
+            try:
+                for client in self._clients:
+                    await self._prepare_handle(client)
 
-            while len(self._tasks) > 0:
-                await asyncio.sleep(0.3)
-                for task in self._tasks:
-                    if task.done():
+                while len(self._tasks) > 0:
+                    done, _ = await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
                         self._tasks.remove(task)
                         result = task.result()
-                        exception = task.exception()
 
                         if result['status'] == 200:
                             if self._progress:
                                 self._progress(self._file_size, self._file_size)
                             return result["content"]
                         if result['status'] in (202, 416):
-                            client = self._get_client_from_request(result['request_info'])
+                            client = result['client']
+
+                            if not self._is_acknowledged(client, result['headers']):
+                                # the server did not store the chunk: send the same byte range again
+                                if client['resent'] >= self._CHUNK_RETRIES:
+                                    raise DailymotionXuploadError(
+                                        'Chunk {} not acknowledged by the server'.format(client['headers']['Content-Range'])
+                                    )
+                                client['resent'] += 1
+                                self._tasks.append(
+                                    asyncio.ensure_future(self._post_chunk(self._url, client))
+                                )
+                                continue
+
                             client['sent'] += client['size']
 
                             if self._progress:
@@ -111,29 +272,42 @@ class Xupload(object):
                                     sent += c['sent']
                                 self._progress(min(sent,self._file_size), self._file_size)
 
-                            ranges = []
-                            range_header = result['headers'].get('Range').split('/')
-                            if len(range_header) > 0:
-                                ranges = [r.split('-') for r in range_header[0].split(',')]
-
-                            for r_start, r_end in [[int(i), int(j)] for i,j in ranges]:
-                                if client['start'] >= r_start and client['start'] < r_end:
-                                    if client['end'] <= r_end:
-                                        break
-                                    if (r_end - client['start'] + 1) % self._chunk_size == 0:
-                                        client['offset'] = r_end + 1
-                                        await self._prepare_handle(client)
-                                        break
+                            if client['offset'] + client['size'] - 1 < client['end']:
+                                client['offset'] += client['size']
+                                await self._prepare_handle(client)
                         elif 'content' in result and 'error' in result['content']:
                             return result['content']
+            finally:
+                for task in self._tasks:
+                    task.cancel()
+
+    @staticmethod
+    def _is_acknowledged(client, headers):
+        """
+        Check that the byte range of the chunk is part of the ranges the server acknowledged
+        in its `Range` header (eg: `0-4194303,8388608-12582911/20971520`)
+        """
+        range_header = headers.get('Range')
+        if not range_header:
+            return False
 
-                        if exception:
-                            raise DailymotionXuploadError(str(exception))
+        first = client['offset']
+        last = client['offset'] + client['size'] - 1
+        for r in range_header.split('/')[0].split(','):
+            try:
+                r_start, r_end = [int(i) for i in r.split('-')]
+            except ValueError:
+                continue
+            if r_start <= first and last <= r_end:
+                return True
+        return False
 
-    def _get_client_from_request(self, request_info):
-        for client in self._clients:
-            if client['headers']['Content-Range'] == request_info.headers['Content-Range']:
-                return client
+    def _get_chunk_timeout(self, size):
+        return aiohttp.ClientTimeout(
+            total=self._CHUNK_TIMEOUT + size * self._workers / self._UPLINK_MIN_THROUGHPUT,
+            sock_connect=self._CONNECT_TIMEOUT,
+            sock_read=self._READ_TIMEOUT
+        )
 
     @staticmethod
     def print_progress(current, total):
@@ -154,24 +328,68 @@ class Xupload(object):
         )
 
     async def _post_chunk(self, url, client):
+        """
+        Send the chunk of the client, retrying with an exponential backoff on network errors,
+        timeouts and server errors. Only the byte range of this chunk is sent again.
+        """
+        # ValueError: the response body is not valid JSON
+        retry_errors = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+        timeout = self._get_chunk_timeout(client['size'])
+        error = None
+        for attempt in range(self._CHUNK_RETRIES + 1):
+            if attempt > 0:
+                await asyncio.sleep(self._RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                result = await self._send_chunk(url, client, timeout)
+            except retry_errors as e:
+                error = e
+                continue
+
+            if result['status'] < 500:
+                return result
+            error = 'HTTP {}'.format(result['status'])
+
+        raise DailymotionXuploadError(
+            'Chunk {} failed after {} attempts: {!r}'.format(
+                client['headers']['Content-Range'], self._CHUNK_RETRIES + 1, error
+            )
+        )
+
+    async def _send_chunk(self, url, client, timeout):
+        loop = asyncio.get_event_loop()
+        body = _ChunkBody(client["data"], self._SEND_SLICE, loop)
+        # aiohttp only sends a streamed body without chunked encoding when its length is known
+        headers = dict(client["headers"], **{"Content-Length": str(len(client["data"]))})
+        request = asyncio.ensure_future(self._post_body(url, body, headers, timeout, client))
+        try:
+            while True:
+                done, _ = await asyncio.wait([request], timeout=self._SEND_IDLE_TIMEOUT / 4)
+                if done:
+                    return request.result()
+                if not body.done and loop.time() - body.progress_at > self._SEND_IDLE_TIMEOUT:
+                    raise asyncio.TimeoutError(
+                        'No upload progress for {}s'.format(self._SEND_IDLE_TIMEOUT)
+                    )
+        finally:
+            request.cancel()
+
+    async def _post_body(self, url, body, headers, timeout, client):
         async with self._session.post(
             url,
-            data=client["data"],
-            headers=client["headers"],
+            data=body,
+            headers=headers,
             proxy=self.PROXY_SOCKET,
             expect100=True,
+            timeout=timeout,
         ) as resp:
             return {
                 "status": resp.status,
                 "headers": resp.headers,
-                "content": await resp.json(),
-                "request_info": resp.request_info,
+                "content": await resp.json() if resp.status < 500 else None,
+                "client": client,
             }
 
     async def _get_file_chunk(self, file, chunk_length, chunk_start=0):
         await file.seek(chunk_start)
         return await file.read(chunk_length)
-
-
-class DailymotionXuploadError(Exception):
-    pass
@@ -0,0 +1,95 @@
+""" Local upload server used by the Xupload tests (Python 3.5+ only) """
+import asyncio
+import socket
+import threading
+
+from aiohttp import web
+
+
+class FlakyUploadServer(object):
+    """
+    Accepts chunked uploads like the upload server does, but answers the first attempt of each
+    chunk with a 503 and the second one with a Range header which doesn't cover the chunk.
+    """
+
+    def __init__(self, file_size):
+        self.file_size = file_size
+        self.received = {}
+        self.attempts = []
+        self._loop = asyncio.new_event_loop()
+        self._thread = None
+        self._runner = None
+        self.url = None
+
+    async def _upload(self, request):
+        content_range = request.headers['Content-Range']
+        data = await request.read()
+        self.attempts.append(content_range)
+        if self.attempts.count(content_range) == 1:
+            return web.json_response({}, status=503)
+        if self.attempts.count(content_range) == 2:
+            return web.json_response({}, status=202, headers={'Range': '0-0/%d' % self.file_size})
+
+        start = int(content_range.split(' ')[1].split('-')[0])
+        self.received[start] = data
+        if sum(len(d) for d in self.received.values()) == self.file_size:
+            return web.json_response({'url': 'http://upload/x1'})
+        ranges = ','.join('%d-%d' % (k, k + len(d) - 1) for k, d in sorted(self.received.items()))
+        return web.json_response({}, status=202, headers={'Range': '%s/%d' % (ranges, self.file_size)})
+
+    def start(self):
+        app = web.Application(client_max_size=self.file_size)
+        app.router.add_post('/upload', self._upload)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        self._loop.run_until_complete(site.start())
+        self.url = 'http://127.0.0.1:%d/upload' % site._server.sockets[0].getsockname()[1]
+        self._thread = threading.Thread(target=self._loop.run_forever)
+        self._thread.start()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+
+class StalledUploadServer(object):
+    """
+    Accepts the request headers and answers `100 Continue`, then stops reading: the client's
+    socket buffers fill up and the chunk upload stalls while the body is being sent.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = None
+        self._server = None
+        self._writers = []
+        self.url = None
+
+    async def _handle(self, reader, writer):
+        await reader.readuntil(b'\r\n\r\n')
+        self.requests += 1
+        self._writers.append(writer)
+        writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+    def start(self):
+        sock = socket.socket()
+        # a small receive buffer, inherited by the accepted connections, makes the stall come early
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.bind(('127.0.0.1', 0))
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, sock=sock))
+        self.url = 'http://127.0.0.1:%d/upload' % sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._loop.run_forever)
+        self._thread.start()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        for writer in self._writers:
+            writer.close()
+        self._server.close()
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.close()